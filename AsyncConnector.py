@@ -1,11 +1,179 @@
 import os
+import re
 import time
-import json
+import random
+import itertools
+import collections
+import struct
+import threading
 import traceback
 import aiohttp
 import asyncio
 
 
+try:
+    # Only needed for binary logs
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    # orjson parses JSON several times faster than the standard library
+    from orjson import loads as json_loads
+except ImportError:
+    import json
+
+    def json_loads(data):
+        # The standard library does not accept memoryviews
+        return json.loads(bytes(data))
+
+
+# Size of the file buffer used when writing batches of log rows.
+DEFAULT_BUFFER_CAPACITY = 64 * 1024
+
+# Seconds between periodic flushes of the log buffer.
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Maximum number of log rows waiting for the writer before *get* has to wait,
+# and maximum number of rows joined into a single write.
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+
+# Base delay and upper bound, in seconds, of the exponential retry backoff.
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 30
+
+# Number of workers used by *map* when no max_concurrency is set.
+DEFAULT_MAP_WORKERS = 10
+
+# Default size limit and linger time, in milliseconds, of *get_batch* batches.
+DEFAULT_MAX_BATCH_SIZE = 50
+DEFAULT_LINGER_MS = 10
+
+# Size of the chunks response bodies are read in, which is also the initial
+# size of a pooled read buffer.
+READ_CHUNK_SIZE = 32 * 1024
+
+# Maximum number of idle read buffers kept for reuse.
+BUFFER_POOL_SIZE = 64
+
+# Buffers grown beyond this size by a large body are dropped instead of
+# pooled, so a few big downloads do not stay allocated for good.
+MAX_POOLED_BUFFER = 4 * READ_CHUNK_SIZE
+
+# Length of a binary log record, written before and after it as a
+# little-endian unsigned 32 bit int so frames can be walked in both directions.
+FRAME_HEADER = struct.Struct('<I')
+
+# Template for a single log row, one field per column of the log header. The
+# project name is filled in once, leaving the other fields for each row.
+LOG_ROW_TEMPLATE = '\n{{}};{project};{{}};{{}};{{}};{{}};{{}};{{}};{{}};{{}}'
+
+
+async def rate_limit(delay: float):
+    """
+    Asynchronously waits for a specified number of seconds. Can be used for rate limiting.
+
+    :param delay: The number of seconds to wait.
+    :type delay: float
+    """
+    await asyncio.sleep(delay)
+
+
+def install_uvloop():
+    """
+    Makes asyncio use uvloop's faster event loop when uvloop is installed.
+    Call it before *asyncio.run*.
+
+    :return: True if uvloop was installed, else False
+    :rtype: bool
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def _iter_frames(f):
+    """
+    Yields the offset and length of each complete frame of a binary log,
+    skipping over the frame bodies. A trailing frame cut short by a crash is
+    ignored.
+    """
+    end = f.seek(0, os.SEEK_END)
+    pos = f.seek(0)
+    while pos + FRAME_HEADER.size <= end:
+        length, = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+        pos += FRAME_HEADER.size
+        if pos + length + FRAME_HEADER.size > end:
+            return
+        yield pos, length
+        pos = f.seek(pos + length + FRAME_HEADER.size)
+
+
+def _last_frame(f):
+    """
+    Returns the offset and length of the last complete frame of a binary log,
+    or None if there is none. The length after the last frame locates it, so
+    only the end of the file is read. If the file ends in a frame cut short
+    by a crash, the frames are walked from the start instead.
+    """
+    size = FRAME_HEADER.size
+    end = f.seek(0, os.SEEK_END)
+    if end >= 2 * size:
+        f.seek(end - size)
+        length, = FRAME_HEADER.unpack(f.read(size))
+        start = end - 2 * size - length
+        if start >= 0:
+            f.seek(start)
+            if FRAME_HEADER.unpack(f.read(size))[0] == length:
+                return start + size, length
+    last = None
+    for last in _iter_frames(f):
+        pass
+    return last
+
+
+def read_binary_log(logfile: str):
+    """
+    Iterates over the rows of a log written with *binary_log=True*. Each row
+    is a tuple with the same columns as the text log.
+
+    :param logfile: path to log file
+    :type logfile: str
+
+    :return: generator of rows
+    :rtype: generator
+    """
+    if msgpack is None:
+        raise ImportError("Reading binary logs requires the msgpack package")
+    with open(logfile, 'rb') as f:
+        frames = _iter_frames(f)
+        # The first frame holds the column names
+        next(frames, None)
+        for pos, length in frames:
+            f.seek(pos)
+            yield msgpack.unpackb(f.read(length), use_list=False)
+
+
+class _Batch():
+    """
+    Ids collected for a single bulk request by *AsyncConnector.get_batch*.
+    """
+
+    __slots__ = ('ids', 'max_size', 'full', 'future')
+
+    def __init__(self, loop, max_size: int):
+        self.ids = []
+        self.max_size = max_size
+        # Set once the batch reaches its size limit
+        self.full = asyncio.Event()
+        # Resolves to the bulk response once the batch has been sent
+        self.future = loop.create_future()
+
+
 class AsyncConnector():
     """
     This class implements a method for reliable connection to the internet
@@ -25,13 +193,101 @@ class AsyncConnector():
     :param timeout: seconds the get request will wait for the server to
     respond in order to avoid connection errors.
     :type timeout: int
+
+    :param flush_interval: maximum number of seconds a logged row may stay
+    in the file buffer before it is flushed to disk.
+    :type flush_interval: float
+
+    :param max_concurrency: maximum number of *get* calls allowed to run at
+    the same time. None means no limit.
+    :type max_concurrency: int
+
+    :param project_name: Name used for analyzing the log, unless a call
+    passes its own.
+    :type project_name: str
+
+    :param binary_log: write the log as length-prefixed msgpack records
+    instead of text. Requires msgpack; read it back with *read_binary_log*.
+    :type binary_log: bool
     """
 
-    def __init__(self, logfile: str, overwrite_log=False, n_tries=10, timeout=30):
+    __slots__ = (
+        'n_tries',
+        'timeout',
+        '_timeout_obj',
+        'logfilename',
+        'flush_interval',
+        'max_concurrency',
+        'project_name',
+        'binary_log',
+        'log',
+        '_sem',
+        '_sem_loop',
+        '_buf_pool',
+        '_inflight',
+        '_batches',
+        '_batch_tasks',
+        '_connector',
+        '_session',
+        '_log_q',
+        '_writer_task',
+        '_write_lock',
+        '_unwritten',
+        '_formats',
+        '_fmt',
+        '_counter'
+    )
+
+    # Matches JSON media types such as application/json or
+    # application/vnd.api+json, but not names merely containing "json"
+    _is_json = re.compile(r'[/+]json\s*(?:;|$)', re.IGNORECASE).search
+
+    def __init__(self, logfile: str, overwrite_log=False, n_tries=10, timeout=30,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_concurrency=None, project_name='',
+                 binary_log=False):
+
+        if binary_log and msgpack is None:
+            raise ImportError("binary_log=True requires the msgpack package")
 
         self.n_tries = n_tries
         self.timeout = timeout
+        # Built once instead of letting aiohttp convert the number per request
+        self._timeout_obj = aiohttp.ClientTimeout(total=timeout)
         self.logfilename = logfile
+        self.flush_interval = flush_interval
+        self.max_concurrency = max_concurrency
+        self.project_name = project_name
+        self.binary_log = binary_log
+        # Created on first use, as a semaphore binds to the loop it waits on
+        self._sem = None
+        self._sem_loop = None
+
+        # Idle read buffers reused across responses
+        self._buf_pool = collections.deque(maxlen=BUFFER_POOL_SIZE)
+
+        # Requests currently in flight, keyed by url, row formatter and session
+        self._inflight = {}
+
+        # Open batches keyed by bulk endpoint, session, row formatter and
+        # separator, and the tasks sending them
+        self._batches = {}
+        self._batch_tasks = set()
+
+        # Pooled session owned by the connector, created in __aenter__
+        self._connector = None
+        self._session = None
+
+        # Log rows waiting for the writer task, both created on first use
+        self._log_q = None
+        self._writer_task = None
+        self._write_lock = threading.Lock()
+        # Rows of a batch the writer failed to write
+        self._unwritten = []
+
+        # Row formatters keyed by project name, with the default one bound
+        # once so get() does not pass the project name around
+        self._formats = {}
+        self._fmt = self._row_format(project_name)
 
         header = [
             'call_id',
@@ -46,149 +302,713 @@ class AsyncConnector():
             'error'
         ]
 
+        if binary_log:
+            mode = 'b'
+            header_row = AsyncConnector._frame(header)
+        else:
+            mode = ''
+            header_row = ';'.join(header) + '\n'
+
         if os.path.isfile(logfile):
             # If the log file already exists then check to see if the file should
-            # be overwritten else append to the existing file
-            if overwrite_log:
-                self.log = open(logfile, 'w')
-                self.log.write(';'.join(header) + '\n')
+            # be overwritten else append to the existing file. A binary log
+            # that lost even its header to a crash is started afresh
+            if overwrite_log or (binary_log and AsyncConnector._truncate_torn_frame(logfile) == 0):
+                self.log = open(logfile, 'w' + mode, buffering=DEFAULT_BUFFER_CAPACITY)
+                self.log.write(header_row)
                 self.log.flush()
             else:
-                self.log = open(logfile, 'a')
+                self.log = open(logfile, 'a' + mode, buffering=DEFAULT_BUFFER_CAPACITY)
         else:
-            self.log = open(logfile, 'w')
-            self.log.write(';'.join(header) + '\n')
+            self.log = open(logfile, 'w' + mode, buffering=DEFAULT_BUFFER_CAPACITY)
+            self.log.write(header_row)
             self.log.flush()
 
-        # Read the file to determine the next call id
-        with open(logfile, 'r') as f:
-            lines = f.readlines()
-            if len(lines) <= 1:
-                self.call_id = 0
-            else:
-                # Assume id is the first entry in the last line and is an integer
-                last_line = lines[-1]
-                last_id = last_line.split(';')[0]
-                try:
-                    self.call_id = int(last_id) + 1
-                except ValueError:
-                    self.call_id = 0
+        # Read the end of the file to determine the next call id
+        if binary_log:
+            next_call_id = AsyncConnector._next_call_id_binary(logfile)
+        else:
+            next_call_id = AsyncConnector._next_call_id(logfile)
+        self._counter = itertools.count(next_call_id)
 
     @staticmethod
-    async def rate_limit(delay: float):
+    def _frame(row):
+        """
+        Packs a row with msgpack and surrounds it with its length.
+        """
+        blob = msgpack.packb(row)
+        length = FRAME_HEADER.pack(len(blob))
+        return length + blob + length
+
+    @staticmethod
+    def _truncate_torn_frame(logfile: str):
+        """
+        Cuts a record torn by a crash off the end of a binary log, so records
+        appended afterwards can still be read.
+
+        :param logfile: path to log file
+        :type logfile: str
+
+        :return: the size of the log after truncation
+        :rtype: int
+        """
+        with open(logfile, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            last = _last_frame(f)
+            complete = 0 if last is None else last[0] + last[1] + FRAME_HEADER.size
+            if complete < end:
+                f.truncate(complete)
+        return complete
+
+    @staticmethod
+    def _next_call_id_binary(logfile: str):
+        """
+        Determines the next call id from the last complete record of a binary
+        log, reading only the end of the file unless it ends in a torn record.
+
+        :param logfile: path to log file
+        :type logfile: str
+
+        :return: the call id following the last logged one, or 0
+        :rtype: int
+        """
+        size = FRAME_HEADER.size
+        with open(logfile, 'rb') as f:
+            last = _last_frame(f)
+            if last is None or last[0] == size:
+                # Only the header (or nothing) has been written so far
+                return 0
+            pos, length = last
+            f.seek(pos)
+            row = msgpack.unpackb(f.read(length))
+        try:
+            return int(row[0]) + 1
+        except (ValueError, TypeError, IndexError):
+            return 0
+
+    @staticmethod
+    def _next_call_id(logfile: str, block_size=4096):
+        """
+        Determines the next call id from the last row of the log file. Only
+        the tail of the file is read, so startup cost does not grow with the
+        size of the log. Error fields can hold multi-line tracebacks, so lines
+        not starting with a call id are skipped.
+
+        :param logfile: path to log file
+        :type logfile: str
+
+        :param block_size: number of bytes initially read from the end of the
+        file; doubled for each further block until a row is found.
+        :type block_size: int
+
+        :return: the call id following the last logged one, or 0
+        :rtype: int
+        """
+        with open(logfile, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            partial = b''
+            while pos > 0:
+                start = max(0, pos - block_size)
+                f.seek(start)
+                lines = (f.read(pos - start) + partial).split(b'\n')
+                pos = start
+                # The first line may continue in the block before this one
+                partial = lines.pop(0) if pos > 0 else b''
+                for line in reversed(lines):
+                    # A row has one field per column, the first being the id
+                    call_id = line.split(b';', 1)[0]
+                    if call_id.isdigit() and line.count(b';') >= 9:
+                        return int(call_id) + 1
+                block_size *= 2
+
+        # Only the header (or nothing) has been written so far
+        return 0
+
+    def _row_format(self, project_name: str):
+        """
+        Returns the row formatter for a project, with the project name baked
+        into the template. Separators in the name are replaced so they cannot
+        break the row. Binary logs get a formatter packing the row instead.
+
+        :param project_name: Name used for analyzing the log.
+        :type project_name: str
+
+        :return: format function taking the remaining row fields
+        :rtype: callable
+        """
+        fmt = self._formats.get(project_name)
+        if fmt is not None:
+            return fmt
+
+        if self.binary_log:
+            frame = AsyncConnector._frame
+
+            def fmt(call_id, *fields):
+                return frame((call_id, project_name) + fields)
+        else:
+            field = project_name.replace(';', ',').replace('\n', ' ')
+            field = field.replace('{', '{{').replace('}', '}}')
+            fmt = LOG_ROW_TEMPLATE.format(project=field).format
+
+        self._formats[project_name] = fmt
+        return fmt
+
+    # Kept on the class for callers using AsyncConnector.rate_limit
+    rate_limit = staticmethod(rate_limit)
+
+    @staticmethod
+    def _backoff(attempt: int):
+        """
+        Returns the delay before the next retry using exponential backoff with
+        full jitter, so concurrent callers do not retry in lockstep.
+
+        :param attempt: zero based number of the attempt that just failed.
+        :type attempt: int
+
+        :return: seconds to wait
+        :rtype: float
+        """
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _write_batch(self, data, flush: bool):
         """
-        Asynchronously waits for a specified number of seconds. Can be used for rate limiting.
-        
-        :param delay: The number of seconds to wait.
-        :type delay: float
+        Writes a batch of log rows and optionally flushes the file. Runs on the
+        default executor so the event loop never blocks on disk I/O. The lock
+        keeps writes from other threads from interleaving with it.
         """
-        await asyncio.sleep(delay)
+        with self._write_lock:
+            if data:
+                self.log.write(data)
+            if flush:
+                self.log.flush()
+
+    async def _log_writer(self):
+        """
+        Background task writing queued log rows in batches. Rows are flushed
+        at most *flush_interval* seconds after they were written, also when
+        the queue runs dry. Stops after writing everything queued before the
+        None sent by *aclose*. The rows of a batch that fails to be written
+        are kept for the next writer or *aclose*.
+        """
+        loop = asyncio.get_running_loop()
+        joiner = b'' if self.binary_log else ''
+        # Time by which the rows written since the last flush must be flushed
+        deadline = None
+        get = None
+        try:
+            while True:
+                if get is None:
+                    get = loop.create_task(self._log_q.get())
+                timeout = None if deadline is None else max(0, deadline - loop.time())
+                # The get task survives the timeout, so no row is lost
+                done, _ = await asyncio.wait((get,), timeout=timeout)
+                if not done:
+                    await loop.run_in_executor(None, self._write_batch, None, True)
+                    deadline = None
+                    continue
+
+                row, get = get.result(), None
+                # Rows of a failed batch go first
+                batch, self._unwritten = self._unwritten, []
+                while row is not None:
+                    batch.append(row)
+                    if len(batch) >= LOG_BATCH_SIZE or self._log_q.empty():
+                        break
+                    row = self._log_q.get_nowait()
+
+                stop = row is None
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+                flush = stop or loop.time() >= deadline
+                try:
+                    await loop.run_in_executor(None, self._write_batch, joiner.join(batch), flush)
+                except asyncio.CancelledError:
+                    # The executor still writes the batch
+                    raise
+                except Exception:
+                    self._unwritten = batch
+                    raise
+                if flush:
+                    deadline = None
+                if stop:
+                    return
+        except asyncio.CancelledError:
+            # The loop is shutting down without aclose, so save what is left.
+            # The write lock waits for a batch still being written
+            if get is not None and get.done() and not get.cancelled() and get.result() is not None:
+                self._unwritten.append(get.result())
+            self._write_batch(joiner.join(self._drain_queue()), True)
+            raise
+        finally:
+            if get is not None:
+                get.cancel()
+
+    def _ensure_writer(self):
+        """
+        Starts the background log writer on the running event loop if it is
+        not already running. Rows still queued are kept for the new writer.
+
+        :return: the error the previous writer died with, or None
+        :rtype: Exception
+        """
+        task = self._writer_task
+        if task is not None and not task.done():
+            return None
+
+        if self._log_q is None or self._log_q.empty():
+            # A fresh queue binds to the currently running loop
+            self._log_q = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._writer_task = asyncio.get_running_loop().create_task(self._log_writer())
+
+        if task is not None and not task.cancelled():
+            return task.exception()
+        return None
+
+    async def _put_row(self, row):
+        """
+        Queues a log row for the writer. Waits while the queue is full, but
+        restarts the writer if it dies meanwhile, instead of waiting for room
+        that never comes. The error of a dead writer is raised once the row
+        is queued.
+        """
+        error = None
+        while True:
+            error = self._ensure_writer() or error
+            if not self._log_q.full():
+                self._log_q.put_nowait(row)
+                break
+            put = asyncio.ensure_future(self._log_q.put(row))
+            try:
+                await asyncio.wait([put, self._writer_task], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not put.done():
+                    put.cancel()
+                    # Let the cancellation settle so we know whether the row
+                    # made it into the queue
+                    await asyncio.wait([put])
+            if not put.cancelled():
+                break
+        if error is not None:
+            raise error
+
+    def _drain_queue(self):
+        """
+        Removes and returns all rows not yet written, starting with those of
+        a failed batch.
+        """
+        rows, self._unwritten = self._unwritten, []
+        while self._log_q is not None and not self._log_q.empty():
+            row = self._log_q.get_nowait()
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    async def aclose(self):
+        """
+        Stops the background log writer once it has written every queued row,
+        and flushes the log to disk.
+        """
+        error = None
+        task, self._writer_task = self._writer_task, None
+        if task is not None:
+            # Let the writer finish instead of cancelling it halfway through a
+            # write, otherwise two threads could touch the file
+            if not task.done():
+                await self._log_q.put(None)
+            try:
+                await task
+            except Exception as e:
+                error = e
+        if not self.log.closed:
+            # Rows queued after the stop marker, or left by a failed writer
+            rows = self._drain_queue()
+            data = (b'' if self.binary_log else '').join(rows)
+            await asyncio.get_running_loop().run_in_executor(None, self._write_batch, data, True)
+        if error is not None:
+            raise error
+
+    async def __aenter__(self):
+        """
+        Opens a pooled aiohttp.ClientSession that is reused by all *get* calls
+        made without an explicit session.
+        """
+        self._connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency or 100,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=self._timeout_obj
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """
+        Closes the pooled session and writes any pending log rows to disk.
+        """
+        await self._session.close()
+        self._session = None
+        self._connector = None
+        await self.aclose()
+
+    def _resolve_session(self, session):
+        """
+        Returns the given session, falling back to the pooled one.
+        """
+        if session is not None:
+            return session
+        if self._session is None:
+            raise RuntimeError(
+                "No session available: pass a session or use "
+                "'async with AsyncConnector(...)' to open a pooled one"
+            )
+        return self._session
 
-    async def get(self, session: aiohttp.ClientSession, url: str, project_name: str):
+    async def get(self, url: str, project_name: str = None, session: aiohttp.ClientSession = None):
         """
         Method for Asyncconnector to send asynchronous GET requests reliably to the
         internet, with multiple tries and simple error handling, as well as a
         simple logging function.
 
-        :param session: aiohttp.ClientSession object
-        :type session: aiohttp.ClientSession object
+        Concurrent calls for the same url, project name and session share a
+        single request: callers arriving while it is in flight wait for it and
+        receive the same response object. Only one log row is written for it.
 
         :param url: url to send a get request
         :type url: str
 
-        :param project_name: Name used for analyzing the log.
+        :param project_name: Name used for analyzing the log. Defaults to the
+        project name given to the connector.
         :type project_name: str
 
+        :param session: aiohttp.ClientSession object. Defaults to the pooled
+        session opened by *async with*.
+        :type session: aiohttp.ClientSession object
+
         :return: GET request response in JSON format
         :rtype: dict
         """
 
-        for _ in range(self.n_tries):
-            t_start = time.time()
+        if isinstance(url, aiohttp.ClientSession):
+            raise TypeError(
+                "get() takes the url first; pass the session as "
+                "get(url, project_name, session=session)"
+            )
+        session = self._resolve_session(session)
+        fmt = self._fmt if project_name is None else self._row_format(project_name)
+
+        key = (url, fmt, session)
+        task = self._inflight.get(key)
+        if task is None:
+            # The request runs as its own task so that no caller, including
+            # the one starting it, can cancel it for the others
+            task = asyncio.get_running_loop().create_task(self._limited_get(session, url, fmt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _limited_get(self, session: aiohttp.ClientSession, url: str, fmt):
+        """
+        Runs *_get* within the max_concurrency limit.
+        """
+        if self.max_concurrency is None:
+            return await self._get(session, url, fmt)
+        loop = asyncio.get_running_loop()
+        if self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._sem_loop = loop
+        async with self._sem:
+            return await self._get(session, url, fmt)
+
+    async def map(self, urls, project_name: str = None, session: aiohttp.ClientSession = None):
+        """
+        Sends GET requests for all urls using a fixed pool of workers fed by a
+        bounded queue, so only a limited number of requests is pending at any
+        time no matter how many urls are given.
+
+        :param urls: urls to send get requests to
+        :type urls: iterable of str
+
+        :param project_name: Name used for analyzing the log. Defaults to the
+        project name given to the connector.
+        :type project_name: str
+
+        :param session: aiohttp.ClientSession object. Defaults to the pooled
+        session opened by *async with*.
+        :type session: aiohttp.ClientSession object
+
+        :return: GET request responses in the same order as urls
+        :rtype: list
+        """
+        if isinstance(urls, aiohttp.ClientSession):
+            raise TypeError(
+                "map() takes the urls first; pass the session as "
+                "map(urls, project_name, session=session)"
+            )
+        session = self._resolve_session(session)
+        n_workers = self.max_concurrency or DEFAULT_MAP_WORKERS
+        queue = asyncio.Queue(maxsize=2 * n_workers)
+        results = {}
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                i, url = item
+                results[i] = await self.get(url, project_name, session)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+
+        async def feed(item):
+            if not queue.full():
+                queue.put_nowait(item)
+                return
+            # Wait for room in the queue, but stop as soon as a worker fails,
+            # otherwise nobody would ever make room
+            put = asyncio.ensure_future(queue.put(item))
             try:
-                async with session.get(url, timeout=self.timeout) as response:
-                    t_end = time.time()
-                    #r = await response.json()
-                    error = ''
-                    success = True
+                while not put.done():
+                    done, _ = await asyncio.wait([put, *workers], return_when=asyncio.FIRST_COMPLETED)
+                    for w in done:
+                        if w is not put:
+                            # Raises the exception the worker died with
+                            w.result()
+            finally:
+                put.cancel()
+
+        n_urls = 0
+        try:
+            for i, url in enumerate(urls):
+                await feed((i, url))
+                n_urls = i + 1
+            for _ in workers:
+                await feed(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+
+        return [results[i] for i in range(n_urls)]
+
+    async def get_batch(self, ids, bulk_endpoint_fmt: str, project_name: str = None,
+                        session: aiohttp.ClientSession = None, sep=',',
+                        max_batch_size=DEFAULT_MAX_BATCH_SIZE, linger_ms=DEFAULT_LINGER_MS):
+        """
+        Fetches ids through a bulk endpoint instead of one request per id.
+        Ids from concurrent calls for the same endpoint, session, project name
+        and separator are collected into shared batches. A batch is sent once it holds *max_batch_size* ids or
+        *linger_ms* milliseconds after its first id arrived, whichever comes
+        first. The limits of a batch are those of the call that opened it.
+
+        :param ids: ids to fetch
+        :type ids: iterable
+
+        :param bulk_endpoint_fmt: url of the bulk endpoint with a single {}
+        placeholder for the joined ids, e.g. 'https://api.example.com/items?ids={}'
+        :type bulk_endpoint_fmt: str
+
+        :param project_name: Name used for analyzing the log. Defaults to the
+        project name given to the connector.
+        :type project_name: str
+
+        :param session: aiohttp.ClientSession object. Defaults to the pooled
+        session opened by *async with*.
+        :type session: aiohttp.ClientSession object
+
+        :param sep: separator used to join the ids of a batch.
+        :type sep: str
+
+        :param max_batch_size: maximum number of ids in one bulk request.
+        :type max_batch_size: int
+
+        :param linger_ms: milliseconds a batch waits for more ids.
+        :type linger_ms: float
+
+        :return: the bulk response of the batch each id was sent in, keyed by id
+        :rtype: dict
+        """
+        session = self._resolve_session(session)
+        loop = asyncio.get_running_loop()
+        fmt = self._fmt if project_name is None else self._row_format(project_name)
+
+        key = (bulk_endpoint_fmt, session, fmt, sep)
+        futures = {}
+        for id_ in ids:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = _Batch(loop, max_batch_size)
+                self._batches[key] = batch
+                task = loop.create_task(self._send_batch(batch, key, project_name, linger_ms / 1000))
+                # Keep a reference so the task is not garbage collected
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+
+            if id_ not in batch.ids:
+                batch.ids.append(id_)
+            futures[id_] = batch.future
+
+            if len(batch.ids) >= batch.max_size:
+                # Close the batch so further ids start a new one
+                del self._batches[key]
+                batch.full.set()
+
+        # Await every batch together so a failing one does not leave the
+        # errors of the others unretrieved
+        batch_futures = list(dict.fromkeys(futures.values()))
+        responses = await asyncio.gather(*(asyncio.shield(fut) for fut in batch_futures))
+        by_future = dict(zip(batch_futures, responses))
+        return {id_: by_future[fut] for id_, fut in futures.items()}
+
+    async def _send_batch(self, batch: _Batch, key: tuple, project_name: str, linger: float):
+        """
+        Waits until the batch is full or has lingered long enough, then sends
+        it as one bulk request and resolves its future. *key* is the key of
+        the batch in the open batches, see *get_batch*.
+        """
+        try:
+            await asyncio.wait_for(batch.full.wait(), linger)
+        except asyncio.TimeoutError:
+            pass
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+
+        bulk_endpoint_fmt, session, _, sep = key
+        url = bulk_endpoint_fmt.format(sep.join(map(str, batch.ids)))
+        try:
+            r = await self.get(url, project_name, session)
+        except asyncio.CancelledError:
+            batch.future.cancel()
+            raise
+        except Exception as e:
+            # Hand the error to the callers instead of failing this task
+            batch.future.set_exception(e)
+        else:
+            batch.future.set_result(r)
+
+    async def _read_body(self, response):
+        """
+        Streams the response body into a pooled buffer. The buffer keeps its
+        length between uses and is overwritten from the start, so only the
+        first *size* bytes belong to this response.
+
+        :param response: aiohttp.ClientResponse object
+        :type response: aiohttp.ClientResponse object
+
+        :return: the buffer and the number of bytes read into it
+        :rtype: tuple
+        """
+        buf = self._buf_pool.pop() if self._buf_pool else bytearray(READ_CHUNK_SIZE)
+        size = 0
+        try:
+            async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                end = size + len(chunk)
+                buf[size:end] = chunk
+                size = end
+        except BaseException:
+            self._release_buffer(buf)
+            raise
+        return buf, size
+
+    def _release_buffer(self, buf: bytearray):
+        """
+        Returns a read buffer to the pool unless it has grown too large.
+        """
+        if len(buf) <= MAX_POOLED_BUFFER:
+            self._buf_pool.append(buf)
+
+    async def _get(self, session: aiohttp.ClientSession, url: str, fmt):
+        """
+        Sends the GET request with retries and logging; see *get*.
+        """
+        for attempt in range(self.n_tries):
+            # Each attempt gets exactly one call id and writes exactly one row
+            current_call_id = next(self._counter)
+            # Wall clock time for the log, monotonic clock for the duration so
+            # clock adjustments cannot distort delta_t
+            t_start_wall = time.time()
+            t_start = time.monotonic_ns()
+            t_end = None
+            redirect_url = ''
+            size = 0
+            response_code = ''
+            r = None
+            try:
+                async with session.get(url, timeout=self._timeout_obj) as response:
+                    t_end = time.monotonic_ns()
                     redirect_url = str(response.url)
-                    dt = t_end - t_start
-                    #size = len(json.dumpr(r))
                     response_code = response.status
-                    current_call_id = self.call_id
-                    self.call_id += 1
-
-                    content_type = response.headers.get('Content-Type')
-                    if 'json' in content_type:
-                        r = await response.json()
-                        size = len(json.dumps(r))
-                    else:
-                        # Handle non-JSON response
-                        r = await response.text()
-                        size = len(r)
-
-                    row = [
-                        current_call_id,
-                        project_name,
-                        t_start,
-                        dt,
-                        url,
-                        redirect_url,
-                        size,
-                        response_code,
-                        success,
-                        error
-                    ]
-
-                    if response_code >= 500:
-                        await AsyncConnector.rate_limit(self.timeout)
-                        continue  # Retry in case of server error
-
-                self.log.write('\n' + ';'.join(map(str, row)))
-                self.log.flush()
 
-                return r
+                    # Read the body once and measure its size in bytes instead
+                    # of serializing the parsed response again
+                    buf, size = await self._read_body(response)
+                    try:
+                        # Server errors are retried, so their bodies (often
+                        # empty or an HTML error page) are not parsed
+                        if response_code < 500:
+                            content_type = response.headers.get('Content-Type') or ''
+                            with memoryview(buf) as view, view[:size] as body:
+                                if self._is_json(content_type):
+                                    r = json_loads(body)
+                                else:
+                                    # Handle non-JSON response
+                                    r = str(body, response.charset or 'utf-8', 'replace')
+                    finally:
+                        self._release_buffer(buf)
+
+                # Retry in case of server error. Client errors (4xx) are
+                # permanent, so they are returned without retrying
+                success = response_code < 500
+                error = '' if success else 'Server error'
+                retry = not success
 
             except aiohttp.ClientConnectionError:
                 error = "Connection error"
                 success = False
+                retry = True
 
             except asyncio.TimeoutError:
                 error = "Timeout error"
                 success = False
+                retry = True
 
-            except Exception as e:
+            except aiohttp.ClientError:
+                # Other transport failures, e.g. a truncated body, are transient
                 error = traceback.format_exc()
                 success = False
+                retry = True
 
-            finally:
-                t_end = time.time()
-                redirect_url = ''
-                dt = t_end - t_start
-                size = 0
-                response_code = ''
-                current_call_id = self.call_id
-                self.call_id += 1
-                row = [
-                    current_call_id,
-                    project_name,
-                    t_start,
-                    dt,
-                    url,
-                    redirect_url,
-                    size,
-                    response_code,
-                    success,
-                    error
-                ]
-                self.log.write('\n' + ';'.join(map(str, row)))
-                self.log.flush()
+            except (ValueError, LookupError):
+                # The body could not be parsed or decoded, which another
+                # attempt will not change
+                error = traceback.format_exc()
+                success = False
+                retry = False
+
+            except Exception:
+                error = traceback.format_exc()
+                success = False
+                retry = True
+
+            if t_end is None:
+                t_end = time.monotonic_ns()
+            dt = (t_end - t_start) / 1e9
+            await self._put_row(fmt(current_call_id, t_start_wall, dt, url,
+                                    redirect_url, size, response_code, success, error))
+
+            if not retry:
+                return r
 
-                await AsyncConnector.rate_limit(self.timeout)
+            if attempt + 1 < self.n_tries:
+                await rate_limit(self._backoff(attempt))
 
     def __del__(self):
         """
         Destructor method to clean up resources before the object is destroyed.
         """
         if hasattr(self, 'log') and not self.log.closed:
+            rows = self._drain_queue()
+            if rows:
+                self.log.write((b'' if self.binary_log else '').join(rows))
             self.log.close()
\ No newline at end of file
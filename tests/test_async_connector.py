@@ -0,0 +1,502 @@
+import asyncio
+import time
+import traceback
+
+import aiohttp
+import pytest
+
+import AsyncConnector as ac
+from AsyncConnector import AsyncConnector
+
+
+class StubContent:
+
+    def __init__(self, body, delay):
+        self.body = body
+        self.delay = delay
+
+    async def iter_chunked(self, n):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        for i in range(0, len(self.body), n):
+            yield self.body[i:i + n]
+
+
+class StubResponse:
+
+    def __init__(self, url, status, body, content_type, delay):
+        self.url = url
+        self.status = status
+        self.headers = {'Content-Type': content_type}
+        self.charset = None
+        self.content = StubContent(body, delay)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class StubSession:
+    """
+    Stands in for aiohttp.ClientSession. Each planned outcome is either an
+    exception to raise or a (status, body) tuple; the last one repeats.
+    """
+
+    def __init__(self, *plan, content_type='application/json', delay=0):
+        self.plan = list(plan) or [(200, b'{}')]
+        self.content_type = content_type
+        self.delay = delay
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        outcome = self.plan.pop(0) if len(self.plan) > 1 else self.plan[0]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        status, body = outcome
+        return StubResponse(url, status, body, self.content_type, self.delay)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(ac, 'BACKOFF_BASE', 0.001)
+
+
+def log_rows(path):
+    with open(path) as f:
+        return [line.split(';') for line in f.read().splitlines()[1:] if line]
+
+
+def write_log(path, *rows):
+    header = 'call_id;project;t;delta_t;url;redirect_url;response_size;response_code;success;error'
+    path.write_text('\n'.join((header,) + rows) + '\n')
+
+
+def test_next_call_id_reads_last_row(tmp_path):
+    logfile = tmp_path / 'log.csv'
+    write_log(logfile, *(f'{i};p;0;0;u;u;0;200;True;' for i in range(1000)))
+    assert AsyncConnector._next_call_id(str(logfile), block_size=16) == 1000
+
+
+def test_next_call_id_of_empty_log(tmp_path):
+    logfile = tmp_path / 'log.csv'
+    write_log(logfile)
+    assert AsyncConnector._next_call_id(str(logfile)) == 0
+    logfile.write_bytes(b'')
+    assert AsyncConnector._next_call_id(str(logfile)) == 0
+
+
+def test_next_call_id_skips_multi_line_errors(tmp_path):
+    logfile = tmp_path / 'log.csv'
+    try:
+        raise ValueError('12;a;b;c;d;e;f;g;h;i\n34')
+    except ValueError:
+        error = traceback.format_exc()
+    write_log(logfile, '6;p;0;0;u;u;0;200;True;', f'7;p;0;0;u;;0;;False;{error}')
+    assert error.count('\n') > 2
+    for block_size in (8, 4096):
+        assert AsyncConnector._next_call_id(str(logfile), block_size) == 8
+
+
+def test_map_keeps_order_and_limits_concurrency(tmp_path):
+    session = StubSession(content_type='text/plain')
+    active = []
+    peak = []
+
+    class Connector(AsyncConnector):
+        async def _get(self, session, url, fmt):
+            active.append(url)
+            peak.append(len(active))
+            await asyncio.sleep(0.001)
+            active.remove(url)
+            return url
+
+    async def main():
+        connector = Connector(str(tmp_path / 'log.csv'), max_concurrency=3)
+        r = await connector.map((f'http://x/{i}' for i in range(20)), session=session)
+        await connector.aclose()
+        return r
+
+    assert asyncio.run(main()) == [f'http://x/{i}' for i in range(20)]
+    assert max(peak) == 3
+
+
+def test_map_stops_when_workers_fail(tmp_path):
+
+    class Connector(AsyncConnector):
+        async def _limited_get(self, session, url, fmt):
+            raise RuntimeError('worker failed')
+
+    async def main():
+        connector = Connector(str(tmp_path / 'log.csv'), max_concurrency=2)
+        await asyncio.wait_for(connector.map([f'http://x/{i}' for i in range(50)], session=StubSession()), 5)
+
+    with pytest.raises(RuntimeError, match='worker failed'):
+        asyncio.run(main())
+
+
+def test_concurrency_limit_works_across_event_loops(tmp_path):
+    connector = AsyncConnector(str(tmp_path / 'log.csv'), max_concurrency=1)
+    session = StubSession(content_type='text/plain', delay=0.001)
+
+    async def main():
+        r = await asyncio.gather(*(connector.get(f'http://x/{i}', session=session) for i in range(3)))
+        await connector.aclose()
+        return r
+
+    assert asyncio.run(main()) == ['{}', '{}', '{}']
+    assert asyncio.run(main()) == ['{}', '{}', '{}']
+
+
+def test_get_retries_transient_errors(tmp_path):
+    logfile = tmp_path / 'log.csv'
+    session = StubSession((503, b''), aiohttp.ClientConnectionError(), (200, b'{"a": 1}'))
+
+    async def main():
+        connector = AsyncConnector(str(logfile), n_tries=5, project_name='p')
+        r = await connector.get('http://x', session=session)
+        await connector.aclose()
+        return r
+
+    assert asyncio.run(main()) == {'a': 1}
+    assert len(session.urls) == 3
+    rows = log_rows(logfile)
+    assert [row[0] for row in rows] == ['0', '1', '2']
+    assert [row[8] for row in rows] == ['False', 'False', 'True']
+
+
+def test_get_does_not_retry_client_errors(tmp_path):
+    session = StubSession((404, b'missing'), content_type='text/plain')
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'), n_tries=5)
+        r = await connector.get('http://x', session=session)
+        await connector.aclose()
+        return r
+
+    assert asyncio.run(main()) == 'missing'
+    assert len(session.urls) == 1
+
+
+def test_get_coalesces_concurrent_requests(tmp_path):
+    session = StubSession((200, b'{"a": 1}'), delay=0.05)
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'))
+        first = asyncio.ensure_future(asyncio.wait_for(connector.get('http://x', session=session), 0.01))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(connector.get('http://x', session=session))
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        r = await second
+        await connector.aclose()
+        return r
+
+    # The first caller timing out does not cancel the shared request
+    assert asyncio.run(main()) == {'a': 1}
+    assert len(session.urls) == 1
+
+
+def test_get_does_not_coalesce_across_sessions_or_projects(tmp_path):
+    s1 = StubSession(delay=0.01)
+    s2 = StubSession(delay=0.01)
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'))
+        await asyncio.gather(
+            connector.get('http://x', session=s1),
+            connector.get('http://x', session=s1),
+            connector.get('http://x', 'other', session=s1),
+            connector.get('http://x', session=s2)
+        )
+        await connector.aclose()
+
+    asyncio.run(main())
+    assert len(s1.urls) == 2
+    assert len(s2.urls) == 1
+
+
+def test_get_batch_joins_ids_from_concurrent_callers(tmp_path):
+    session = StubSession(content_type='text/plain')
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'))
+        fmt = 'http://x/items?ids={}'
+        r = await asyncio.gather(
+            connector.get_batch([1, 2, 3], fmt, session=session, max_batch_size=4),
+            connector.get_batch([4, 5], fmt, session=session)
+        )
+        await connector.aclose()
+        return r
+
+    first, second = asyncio.run(main())
+    assert session.urls == ['http://x/items?ids=1,2,3,4', 'http://x/items?ids=5']
+    assert set(first) == {1, 2, 3}
+    assert set(second) == {4, 5}
+
+
+def test_get_batch_keeps_sessions_projects_and_separators_apart(tmp_path):
+    logfile = tmp_path / 'log.csv'
+    s1 = StubSession(content_type='text/plain')
+    s2 = StubSession(content_type='text/plain')
+
+    async def main():
+        connector = AsyncConnector(str(logfile))
+        fmt = 'http://x/items?ids={}'
+        await asyncio.gather(
+            connector.get_batch([1, 2], fmt, project_name='A', session=s1),
+            connector.get_batch([3], fmt, project_name='B', session=s2, sep='|'),
+            connector.get_batch([4, 5], fmt, project_name='B', session=s2, sep='|'),
+            connector.get_batch([6], fmt, project_name='B', session=s1)
+        )
+        await connector.aclose()
+
+    asyncio.run(main())
+    assert sorted(s1.urls) == ['http://x/items?ids=1,2', 'http://x/items?ids=6']
+    assert s2.urls == ['http://x/items?ids=3|4|5']
+    assert sorted((row[1], row[4]) for row in log_rows(logfile)) == [
+        ('A', 'http://x/items?ids=1,2'),
+        ('B', 'http://x/items?ids=3|4|5'),
+        ('B', 'http://x/items?ids=6')
+    ]
+
+
+def test_get_batch_propagates_errors(tmp_path):
+
+    class Connector(AsyncConnector):
+        async def get(self, url, project_name=None, session=None):
+            raise RuntimeError('bulk request failed')
+
+    async def main():
+        connector = Connector(str(tmp_path / 'log.csv'))
+        await connector.get_batch([1, 2], 'http://x/items?ids={}', session=StubSession())
+
+    with pytest.raises(RuntimeError, match='bulk request failed'):
+        asyncio.run(main())
+
+
+def test_read_buffers_are_reused(tmp_path):
+    session = StubSession((200, b'{"a": 1}'))
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'))
+        await connector.get('http://x/1', session=session)
+        pool = list(connector._buf_pool)
+        await connector.get('http://x/2', session=session)
+        assert list(connector._buf_pool) == pool
+        assert connector._buf_pool[0] is pool[0]
+        await connector.aclose()
+
+    asyncio.run(main())
+
+
+def test_large_read_buffers_are_not_pooled(tmp_path):
+    body = b'"' + b'a' * (ac.MAX_POOLED_BUFFER + 1) + b'"'
+    session = StubSession((200, body))
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'))
+        r = await connector.get('http://x', session=session)
+        assert not connector._buf_pool
+        await connector.aclose()
+        return r
+
+    assert len(asyncio.run(main())) == ac.MAX_POOLED_BUFFER + 1
+
+
+def test_read_buffer_is_returned_after_failed_read(tmp_path):
+
+    class FailingContent:
+        async def iter_chunked(self, n):
+            yield b'{"a"'
+            raise aiohttp.ClientPayloadError('truncated')
+
+    class FailingSession(StubSession):
+        def get(self, url, timeout=None):
+            response = super().get(url, timeout)
+            response.content = FailingContent()
+            return response
+
+    async def main():
+        connector = AsyncConnector(str(tmp_path / 'log.csv'), n_tries=1)
+        assert await connector.get('http://x', session=FailingSession()) is None
+        assert len(connector._buf_pool) == 1
+        await connector.aclose()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('content_type, expected', [
+    ('application/json', True),
+    ('application/json; charset=utf-8', True),
+    ('Application/JSON', True),
+    ('application/vnd.api+json', True),
+    ('application/problem+json;charset=utf-8', True),
+    ('text/json ', True),
+    ('text/plain', False),
+    ('text/html; charset=utf-8', False),
+    ('application/jsonp', False),
+    ('application/json-seq', False),
+    ('text/x-jsonish', False),
+    ('', False),
+])
+def test_is_json(content_type, expected):
+    assert bool(AsyncConnector._is_json(content_type)) is expected
+
+
+@pytest.mark.parametrize('project_name, logged', [
+    ('plain', 'plain'),
+    ('a;b', 'a,b'),
+    ('a\nb', 'a b'),
+    ('{}', '{}'),
+    ('{0} {name}', '{0} {name}'),
+])
+def test_project_name_cannot_break_rows(tmp_path, project_name, logged):
+    logfile = tmp_path / 'log.csv'
+    connector = AsyncConnector(str(logfile))
+    row = connector._row_format(project_name)(3, 0.5, 0.25, 'http://x', '', 0, 200, True, '')
+    assert row.count('\n') == 1
+    assert row[1:].split(';') == ['3', logged, '0.5', '0.25', 'http://x', '', '0', '200', 'True', '']
+    assert connector._row_format(project_name) is connector._row_format(project_name)
+    connector.log.close()
+
+
+def write_binary_log(logfile, n, project_name='p'):
+    session = StubSession(content_type='text/plain')
+
+    async def main():
+        connector = AsyncConnector(str(logfile), project_name=project_name, binary_log=True)
+        for i in range(n):
+            await connector.get(f'http://x/{i}', session=session)
+        await connector.aclose()
+        connector.log.close()
+
+    asyncio.run(main())
+
+
+def test_binary_log_round_trip(tmp_path):
+    logfile = tmp_path / 'log.bin'
+    write_binary_log(logfile, 3)
+    rows = list(ac.read_binary_log(str(logfile)))
+    assert [row[:2] for row in rows] == [(0, 'p'), (1, 'p'), (2, 'p')]
+    assert [row[4] for row in rows] == ['http://x/0', 'http://x/1', 'http://x/2']
+    assert all(len(row) == 10 for row in rows)
+
+
+def test_binary_log_next_call_id_reads_only_the_trailer(tmp_path, monkeypatch):
+    logfile = tmp_path / 'log.bin'
+    write_binary_log(logfile, 3)
+
+    def walk(f):
+        raise AssertionError('walked the whole log')
+
+    monkeypatch.setattr(ac, '_iter_frames', walk)
+    assert AsyncConnector._next_call_id_binary(str(logfile)) == 3
+
+
+def test_binary_log_recovers_from_torn_record(tmp_path):
+    logfile = tmp_path / 'log.bin'
+    write_binary_log(logfile, 3)
+    size = logfile.stat().st_size
+    with open(logfile, 'r+b') as f:
+        f.truncate(size - 10)
+
+    # The torn record is found by walking the frames from the start
+    assert AsyncConnector._next_call_id_binary(str(logfile)) == 2
+
+    write_binary_log(logfile, 2)
+    rows = list(ac.read_binary_log(str(logfile)))
+    assert [row[0] for row in rows] == [0, 1, 2, 3]
+    assert [row[4] for row in rows] == ['http://x/0', 'http://x/1', 'http://x/0', 'http://x/1']
+
+
+def test_binary_log_recovers_from_torn_header(tmp_path):
+    logfile = tmp_path / 'log.bin'
+    logfile.write_bytes(b'\x40\x00\x00\x00\x9acall')
+    write_binary_log(logfile, 1)
+    rows = list(ac.read_binary_log(str(logfile)))
+    assert [row[:2] for row in rows] == [(0, 'p')]
+
+
+def make_row(connector, i):
+    return connector._fmt(i, 0.0, 0.0, 'http://x', '', 0, 200, True, '')
+
+
+def test_aclose_writes_every_queued_row(tmp_path):
+    logfile = tmp_path / 'log.csv'
+
+    async def main():
+        connector = AsyncConnector(str(logfile))
+        for i in range(1000):
+            await connector._put_row(make_row(connector, i))
+        await connector.aclose()
+        assert connector._writer_task is None
+
+    asyncio.run(main())
+    assert [int(row[0]) for row in log_rows(logfile)] == list(range(1000))
+
+
+def test_idle_writer_flushes_within_flush_interval(tmp_path):
+    logfile = tmp_path / 'log.csv'
+
+    async def main():
+        connector = AsyncConnector(str(logfile), flush_interval=0.2)
+        await connector._put_row(make_row(connector, 0))
+        await asyncio.sleep(0.15)
+        # A later row does not postpone the flush of the first one
+        await connector._put_row(make_row(connector, 1))
+        await asyncio.sleep(0.13)
+        assert len(log_rows(logfile)) == 2
+        await connector.aclose()
+
+    asyncio.run(main())
+
+
+def test_rows_are_saved_when_loop_stops_without_aclose(tmp_path):
+    logfile = tmp_path / 'log.csv'
+
+    class Connector(AsyncConnector):
+        def _write_batch(self, data, flush):
+            # Slow writes, so the writer is cancelled while one is running
+            time.sleep(0.05)
+            super()._write_batch(data, flush)
+
+    connector = Connector(str(logfile))
+
+    async def main():
+        for i in range(300):
+            await connector._put_row(make_row(connector, i))
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert [int(row[0]) for row in log_rows(logfile)] == list(range(300))
+
+
+def test_writer_restarts_after_failed_write(tmp_path):
+    logfile = tmp_path / 'log.csv'
+
+    class Connector(AsyncConnector):
+        failures = 1
+
+        def _write_batch(self, data, flush):
+            if data and self.failures:
+                self.failures -= 1
+                raise OSError('disk full')
+            super()._write_batch(data, flush)
+
+    async def main():
+        connector = Connector(str(logfile))
+        errors = 0
+        for i in range(39):
+            try:
+                await connector._put_row(make_row(connector, i))
+            except OSError:
+                errors += 1
+            await asyncio.sleep(0)
+        await connector.aclose()
+        return errors
+
+    assert asyncio.run(main()) == 1
+    assert sorted(int(row[0]) for row in log_rows(logfile)) == list(range(39))